@@ -0,0 +1,98 @@
+import asyncio
+
+
+class BatchCollector:
+    """
+    Dynamic batcher for single-question requests.
+
+    Questions submitted within a short window (or until max_batch of them are
+    waiting) are embedded with one Cohere call. Questions the semantic cache
+    already answers are resolved from their embedding; only the misses are
+    searched, with one Qdrant request. Each caller gets back its own
+    (embedding, nodes, cached_answer) triple: nodes is None on a cache hit,
+    cached_answer is None on a miss.
+    """
+
+    def __init__(self, engine, semantic_cache=None, max_batch: int = 32, max_wait: float = 0.010):
+        self.engine = engine
+        self.semantic_cache = semantic_cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._inflight = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+
+    async def submit(self, question: str, hnsw_ef=None):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, hnsw_ef, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Process in the background so the next window starts collecting
+            # while this batch waits on Cohere and Qdrant.
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch):
+        batch = [item for item in batch if not item[-1].done()]
+        if not batch:
+            return
+        questions = [question for question, _, _ in batch]
+        hnsw_efs = [hnsw_ef for _, hnsw_ef, _ in batch]
+        try:
+            embeddings = await self.engine.embed_queries(questions)
+            misses = []
+            for i, embedding in enumerate(embeddings):
+                cached = None
+                if self.semantic_cache is not None:
+                    cached = self.semantic_cache.get(embedding)
+                if cached is None:
+                    misses.append(i)
+                elif not batch[i][-1].done():
+                    batch[i][-1].set_result((embedding, None, cached))
+            contexts = []
+            if misses:
+                contexts = await self.engine.retrieve(
+                    [embeddings[i] for i in misses], [hnsw_efs[i] for i in misses]
+                )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, nodes in zip(misses, contexts):
+            future = batch[i][-1]
+            if not future.done():
+                future.set_result((embeddings[i], nodes, None))
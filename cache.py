@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import logging
+import time
+
+import numpy as np
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case and collapse whitespace so trivially different questions share a key."""
+    return " ".join(question.lower().split())
+
+
+class QueryCache:
+    """
+    Exact-match answer cache keyed by the SHA256 of the normalized question.
+    In-process; see RedisQueryCache for a cache shared between workers.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    async def get(self, question: str):
+        return self._cache.get(self.key(question))
+
+    async def set(self, question: str, answer: str) -> None:
+        self._cache[self.key(question)] = answer
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisQueryCache(QueryCache):
+    """
+    Exact-match answer cache stored in Redis so every uvicorn worker shares
+    one hit rate. Redis errors are logged and treated as cache misses.
+    """
+
+    def __init__(self, client, ttl: float = 3600, prefix: str = "rag:answer:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def get(self, question: str):
+        try:
+            return await self.client.get(self.prefix + self.key(question))
+        except Exception as e:
+            logger.warning("Redis cache read failed: %s", e)
+            return None
+
+    async def set(self, question: str, answer: str) -> None:
+        try:
+            await self.client.set(self.prefix + self.key(question), answer, ex=self.ttl)
+        except Exception as e:
+            logger.warning("Redis cache write failed: %s", e)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class ContextCache:
+    """
+    LLM answer cache keyed by the retrieved context instead of the question:
+    questions worded differently that retrieve the same chunks share an answer.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(nodes):
+        # Node hashes change when a chunk's text changes, so re-ingested
+        # content never serves a stale answer.
+        return hashlib.sha256(
+            b"|".join(f"{n.node.node_id}:{n.node.hash}".encode("utf-8") for n in nodes)
+        ).hexdigest()
+
+    def get(self, nodes):
+        if not nodes:
+            return None
+        return self._cache.get(self.key(nodes))
+
+    def set(self, nodes, answer: str) -> None:
+        if nodes:
+            self._cache[self.key(nodes)] = answer
+
+
+class SemanticCache:
+    """
+    Fuzzy answer cache: returns a stored answer when the query embedding is
+    close enough (cosine similarity) to one that was already answered.
+
+    Embeddings are L2-normalized and stored as INT8 with one float scale per
+    row (a quarter of the float32 footprint), so a lookup is one int8
+    matrix-vector product accumulated in int32. Entries expire after ttl
+    seconds, like the exact-match cache; once full, the oldest entry is
+    overwritten.
+    """
+
+    def __init__(self, maxsize: int = 1000, threshold: float = 0.85, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = None
+        self._scales = np.zeros(maxsize, dtype=np.float32)
+        self._inserted = np.zeros(maxsize, dtype=np.float64)
+        self._answers = []
+        self._next = 0
+
+    def __len__(self):
+        return len(self._answers)
+
+    @staticmethod
+    def _quantize(embedding):
+        """L2-normalize, then map to int8 so that vector ~= quantized * scale."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        peak = float(np.max(np.abs(vector)))
+        scale = peak / 127 if peak else 1.0
+        quantized = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+        return quantized, scale
+
+    def get(self, embedding):
+        if not self._answers:
+            return None
+        size = len(self._answers)
+        query, query_scale = self._quantize(embedding)
+        # int16 would overflow on 1024-dim dot products, so accumulate in int32
+        dots = np.einsum("ij,j->i", self._vectors[:size], query, dtype=np.int32)
+        scores = dots * self._scales[:size] * query_scale
+        expired = self._inserted[:size] < time.monotonic() - self.ttl
+        scores[expired] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] > self.threshold:
+            return self._answers[best]
+        return None
+
+    def set(self, embedding, answer: str) -> None:
+        quantized, scale = self._quantize(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, quantized.shape[0]), dtype=np.int8)
+        slot = self._next
+        self._vectors[slot] = quantized
+        self._scales[slot] = scale
+        self._inserted[slot] = time.monotonic()
+        if slot < len(self._answers):
+            self._answers[slot] = answer
+        else:
+            self._answers.append(answer)
+        self._next = (slot + 1) % self.maxsize
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one in-flight task, so a
+    burst of identical questions triggers a single embed/retrieve/generate.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    @staticmethod
+    def key(*parts) -> str:
+        raw = "\x1f".join(str(part) for part in parts)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so it is not reported as never retrieved
+        # when every waiter was cancelled before the task failed.
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shield so one caller disconnecting does not cancel the shared work
+        return await asyncio.shield(task)
@@ -1,44 +1,197 @@
 import os
+import json
+import asyncio
+import logging
+from typing import Annotated, Literal, Optional
+from contextlib import asynccontextmanager
+import cohere
+import httpx
+import redis.asyncio as redis
 import qdrant_client
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, Query, Request
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from llama_index.core import VectorStoreIndex, StorageContext
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.embeddings.cohere import CohereEmbedding
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from llama_index.llms.cohere import Cohere
 from dotenv import load_dotenv
+from cache import (
+    ContextCache, QueryCache, RedisQueryCache, SemanticCache, SingleFlight, normalize_question
+)
+from rag import RAGEngine
+from batcher import BatchCollector
+
+MAX_BATCH_QUESTIONS = 64
+MAX_QUESTION_LENGTH = 4096
+
+# --- Pydantic Models ---
+# Questions are length-capped so oversized inputs are rejected before they
+# reach (and are billed by) Cohere.
+Question = Annotated[str, Field(min_length=1, max_length=MAX_QUESTION_LENGTH)]
 
-# --- Pydantic Model ---
 class QueryRequest(BaseModel):
-    question: str
+    question: Question
+    # Optional HNSW beam width: lower is faster, higher gives better recall
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1024)
 
-# --- Load Environment Variables & Debug ---
-print("--> [1/12] Loading environment variables...")
+class BatchQueryRequest(BaseModel):
+    questions: list[Question] = Field(min_length=1, max_length=MAX_BATCH_QUESTIONS)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1024)
+
+# --- Load Environment Variables ---
 load_dotenv()
+# Only this module's logger is configured; a root handler would also print
+# httpx's per-request INFO lines for every Cohere call.
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    logger.addHandler(_handler)
 COHERE_API_KEY = os.getenv("CO_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# Dynamic batching of concurrent /query calls
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+# Default HNSW beam width; pick it with tune_ef.py
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "64"))
+# Retrieval width: candidates fetched from Qdrant, and how many MMR keeps
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "8"))
+MMR_TOP_N = int(os.getenv("MMR_TOP_N", "4"))
+MMR_DIVERSITY = float(os.getenv("MMR_DIVERSITY", "0.3"))
+# Optional: share the exact-match answer cache between uvicorn workers
+REDIS_URL = os.getenv("REDIS_URL")
+# Per-request timeout for Cohere embed calls, in seconds
+COHERE_TIMEOUT = float(os.getenv("COHERE_TIMEOUT", "300"))
+
+# --- One-time Setup of RAG Components ---
+async def build_engine(http_client: httpx.AsyncClient):
+    """
+    Creates the Cohere and Qdrant clients and the RAG engine on the running
+    event loop. Cohere requests go through the shared http_client pool.
+    Raises if configuration is missing so startup fails loudly instead of
+    leaving a half-initialized app.
+    """
+    logger.info("[1/4] Checking environment variables...")
+    if not all([COHERE_API_KEY, QDRANT_URL, QDRANT_API_KEY]):
+        logger.error(
+            "COHERE_API_KEY loaded: %s, QDRANT_URL loaded: %s, QDRANT_API_KEY loaded: %s",
+            "Yes" if COHERE_API_KEY else "No",
+            "Yes" if QDRANT_URL else "No",
+            "Yes" if QDRANT_API_KEY else "No",
+        )
+        raise RuntimeError("One or more environment variables are missing!")
+
+    logger.info("[2/4] Initializing Cohere clients...")
+    # With a custom httpx_client the SDK stops applying its 300 s default
+    # and sends timeout=None per request, so set it explicitly.
+    co = cohere.AsyncClient(
+        api_key=COHERE_API_KEY,
+        httpx_client=http_client,
+        timeout=COHERE_TIMEOUT
+    )
+    llm = Cohere(
+        model="command-r-plus",
+        api_key=COHERE_API_KEY
+    )
 
-# Check if variables are loaded
-if not all([COHERE_API_KEY, QDRANT_URL, QDRANT_API_KEY]):
-    print("--> FATAL ERROR: One or more environment variables are missing!")
-    print(f"--> COHERE_API_KEY loaded: {'Yes' if COHERE_API_KEY else 'No'}")
-    print(f"--> QDRANT_URL loaded: {'Yes' if QDRANT_URL else 'No'}")
-    print(f"--> QDRANT_API_KEY loaded: {'Yes' if QDRANT_API_KEY else 'No'}")
-else:
-    print("--> [2/12] All environment variables loaded successfully.")
+    logger.info("[3/4] Initializing Qdrant client...")
+    # gRPC multiplexes concurrent searches over one persistent HTTP/2
+    # connection; the client lives as long as the server does.
+    qdrant = qdrant_client.AsyncQdrantClient(
+        url=QDRANT_URL,
+        api_key=QDRANT_API_KEY,
+        prefer_grpc=True,
+        timeout=30
+    )
+    return RAGEngine(
+        co=co,
+        qdrant=qdrant,
+        llm=llm,
+        collection_name="second",
+        similarity_top_k=SIMILARITY_TOP_K,
+        mmr_top_n=MMR_TOP_N,
+        mmr_diversity=MMR_DIVERSITY,
+        hnsw_ef=QDRANT_HNSW_EF,
+        context_cache=ContextCache(maxsize=1000, ttl=3600)
+    )
+
+async def retry_warmup(app: FastAPI, delay: float = 5, max_delay: float = 300):
+    """
+    Keeps retrying the warmup query with exponential backoff until it
+    succeeds, so a worker whose startup warmup failed becomes ready once
+    Cohere and Qdrant are reachable again.
+    """
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await app.state.rag.warmup()
+        except Exception as e:
+            delay = min(delay * 2, max_delay)
+            logger.warning("Warmup retry failed: %s; next attempt in %.0f s", e, delay)
+            continue
+        app.state.ready = True
+        logger.info("Warmup retry succeeded. RAG components are ready.")
+        return
+
+# --- Lifespan: setup, background batcher and warmup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    # One keep-alive HTTP/2 pool for all Cohere traffic from this worker
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+    app.state.rag = await build_engine(app.state.http_client)
+    if REDIS_URL:
+        app.state.query_cache = RedisQueryCache(
+            redis.from_url(REDIS_URL, decode_responses=True), ttl=3600
+        )
+    else:
+        app.state.query_cache = QueryCache(maxsize=1000, ttl=3600)
+    app.state.singleflight = SingleFlight()
+    app.state.batcher = BatchCollector(
+        app.state.rag,
+        semantic_cache=semantic_cache,
+        max_batch=BATCH_MAX_SIZE,
+        max_wait=BATCH_WINDOW_MS / 1000
+    )
+    app.state.batcher.start()
+    logger.info("[4/4] Warming up...")
+    # uvicorn only serves requests once this startup block returns, so
+    # ready=False is what / reports until a warmup query succeeds.
+    app.state.warmup_task = None
+    try:
+        await app.state.rag.warmup()
+        app.state.ready = True
+        logger.info("SETUP COMPLETE! RAG components are ready.")
+    except Exception as e:
+        logger.warning("Warmup query failed: %s; retrying in the background", e)
+        app.state.warmup_task = asyncio.create_task(retry_warmup(app))
+    yield
+    if app.state.warmup_task is not None:
+        app.state.warmup_task.cancel()
+        try:
+            await app.state.warmup_task
+        except asyncio.CancelledError:
+            pass
+    await app.state.batcher.stop()
+    await app.state.rag.qdrant.close()
+    await app.state.http_client.aclose()
+    await app.state.query_cache.close()
 
 # --- Initialize FastAPI App ---
-print("--> [3/12] Initializing FastAPI app...")
 app = FastAPI(
     title="RAG Chatbot API",
-    description="A simple API to chat with a RAG model powered by Cohere and Qdrant."
+    description="A simple API to chat with a RAG model powered by Cohere and Qdrant.",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
-print("--> [4/12] FastAPI app initialized.")
 
 # --- Add CORS Middleware ---
-print("--> [5/12] Adding CORS middleware...")
 origins = ["*"]
 app.add_middleware(
     CORSMiddleware,
@@ -47,55 +200,112 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-print("--> [6/12] CORS middleware added.")
 
-# --- One-time Setup of RAG Components (with debugging) ---
-try:
-    print("--> [7/12] Initializing Cohere embedding model...")
-    embed_model = CohereEmbedding(
-        model_name="embed-english-v3.0",
-        api_key=COHERE_API_KEY
-    )
-    print("--> [8/12] Initializing Qdrant client...")
-    client = qdrant_client.QdrantClient(
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY
-    )
-    print("--> [9/12] Initializing Qdrant vector store...")
-    vector_store = QdrantVectorStore(
-        client=client,
-        collection_name="second",
-        embed_model=embed_model
-    )
-    storage_context = StorageContext.from_defaults(
-        vector_store=vector_store
-    )
-    print("--> [10/12] Loading index from vector store...")
-    index = VectorStoreIndex.from_vector_store(
-        vector_store=vector_store,
-        embed_model=embed_model,
-        storage_context=storage_context
-    )
-    print("--> [11/12] Initializing Cohere LLM and query engine...")
-    llm = Cohere(
-        model="command-r-plus",
-        api_key=COHERE_API_KEY
-    )
-    query_engine = index.as_query_engine(llm=llm)
-    print("--> [12/12] SETUP COMPLETE! RAG components are ready.")
+# --- Add GZip Middleware ---
+# Long Markdown answers compress several times over. Small payloads are
+# sent as-is, and Starlette skips text/event-stream so /query/stream
+# still flushes each token immediately.
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
+# --- Answer Caches ---
+# Exact hits skip everything; fuzzy hits are resolved by the batcher right
+# after embedding and skip the Qdrant search and the LLM call. The exact cache
+# lives in Redis when REDIS_URL is set (see lifespan); the semantic cache is
+# always per worker.
+semantic_cache = SemanticCache(maxsize=1000, threshold=0.85, ttl=3600)
+
 
-except Exception as e:
-    print(f"--> FATAL ERROR during setup: {e}")
+# --- Output Formatting ---
+OutputFormat = Literal["text", "html"]
+
+def render_answer(raw_text: str, output_format: OutputFormat) -> str:
+    """Answers are plain text/Markdown; format=html keeps the legacy <br> line breaks."""
+    if output_format == "html":
+        return raw_text.replace('\n', '<br>')
+    return raw_text
+
+def sse_event(text: str) -> str:
+    """Frame a chunk of answer text as a server-sent event; JSON keeps newlines intact."""
+    return f"data: {json.dumps({'token': text})}\n\n"
+
+
+async def answer_question(state, query: QueryRequest) -> str:
+    # Embedding and retrieval are shared with other in-flight questions
+    embedding, nodes, raw_text = await state.batcher.submit(
+        query.question, query.ef_search
+    )
+    if raw_text is None:
+        raw_text = await state.rag.synthesize(query.question, nodes)
+        semantic_cache.set(embedding, raw_text)
+    await state.query_cache.set(query.question, raw_text)
+    return raw_text
 
 
 # --- API Endpoints ---
 @app.get("/", summary="Root endpoint to check if the API is running")
-def read_root():
+def read_root(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return ORJSONResponse(
+            status_code=503,
+            content={"message": "The RAG Chatbot API is not ready yet: the warmup query has not succeeded."}
+        )
     return {"message": "Welcome to the RAG Chatbot API! Setup is complete."}
 
 @app.post("/query", summary="Ask a question to the RAG model")
-async def handle_query(request: QueryRequest):
-    response = query_engine.query(request.question)
-    raw_text = str(response)
-    formatted_text = raw_text.replace('\n', '<br>')
-    return {"answer": formatted_text}
\ No newline at end of file
+async def handle_query(
+    query: QueryRequest,
+    request: Request,
+    output_format: OutputFormat = Query("text", alias="format")
+):
+    state = request.app.state
+    raw_text = await state.query_cache.get(query.question)
+    if raw_text is None:
+        # Identical questions already in flight share this one computation,
+        # keyed like the answer caches: ef_search only tunes retrieval on a
+        # miss and never splits cached answers.
+        key = SingleFlight.key(normalize_question(query.question))
+        raw_text = await state.singleflight.do(key, lambda: answer_question(state, query))
+    return {"answer": render_answer(raw_text, output_format)}
+
+@app.post("/query/batch", summary="Ask several questions to the RAG model at once")
+async def handle_batch_query(
+    query: BatchQueryRequest,
+    request: Request,
+    output_format: OutputFormat = Query("text", alias="format")
+):
+    answers = await request.app.state.rag.answer_batch(
+        query.questions, query.ef_search
+    )
+    return {"answers": [render_answer(answer, output_format) for answer in answers]}
+
+@app.post("/query/stream", summary="Ask a question and stream the answer as server-sent events")
+async def handle_stream_query(query: QueryRequest, request: Request):
+    state = request.app.state
+    cached = await state.query_cache.get(query.question)
+    if cached is None:
+        embedding, nodes, cached = await state.batcher.submit(
+            query.question, query.ef_search
+        )
+        if cached is not None:
+            await state.query_cache.set(query.question, cached)
+
+    async def event_stream():
+        if cached is not None:
+            yield sse_event(cached)
+        else:
+            # Tokens are forwarded as soon as Cohere emits them and the full
+            # answer is cached once generation finishes.
+            tokens = []
+            async for token in state.rag.stream(query.question, nodes):
+                tokens.append(token)
+                yield sse_event(token)
+            raw_text = "".join(tokens)
+            semantic_cache.set(embedding, raw_text)
+            await state.query_cache.set(query.question, raw_text)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
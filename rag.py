@@ -0,0 +1,174 @@
+import asyncio
+
+from qdrant_client import models
+from llama_index.core import get_response_synthesizer
+from llama_index.core.indices.query.embedding_utils import get_top_k_mmr_embeddings
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+# Cohere's embed endpoint accepts at most this many texts per request
+COHERE_MAX_EMBED_TEXTS = 96
+
+
+class RAGEngine:
+    """
+    Retrieval and generation over the Qdrant collection, working on batches of
+    questions so one Cohere embed call and one Qdrant request serve them all.
+    """
+
+    def __init__(
+        self,
+        co,
+        qdrant,
+        llm,
+        collection_name: str = "second",
+        embed_model_name: str = "embed-english-v3.0",
+        similarity_top_k: int = 8,
+        mmr_top_n: int = 4,
+        mmr_diversity: float = 0.3,
+        hnsw_ef: int = 64,
+        context_cache=None,
+    ):
+        self.co = co
+        self.qdrant = qdrant
+        self.collection_name = collection_name
+        self.embed_model_name = embed_model_name
+        # similarity_top_k candidates are fetched from Qdrant and MMR keeps the
+        # mmr_top_n most relevant-yet-diverse ones for the prompt, so prompt
+        # length stays fixed however wide the candidate pool is.
+        self.similarity_top_k = similarity_top_k
+        self.mmr_top_n = mmr_top_n
+        self.mmr_diversity = mmr_diversity
+        self.hnsw_ef = hnsw_ef
+        self.context_cache = context_cache
+        self.synthesizer = get_response_synthesizer(llm=llm)
+        self.streaming_synthesizer = get_response_synthesizer(llm=llm, streaming=True)
+
+    async def embed_queries(self, questions: list[str]) -> list[list[float]]:
+        """
+        Embed all questions in a single Cohere request, or in concurrent
+        requests of COHERE_MAX_EMBED_TEXTS each when there are more.
+        """
+        chunks = [
+            questions[i:i + COHERE_MAX_EMBED_TEXTS]
+            for i in range(0, len(questions), COHERE_MAX_EMBED_TEXTS)
+        ]
+        responses = await asyncio.gather(
+            *(
+                self.co.embed(
+                    texts=chunk,
+                    model=self.embed_model_name,
+                    input_type="search_query",
+                )
+                for chunk in chunks
+            )
+        )
+        return [embedding for response in responses for embedding in response.embeddings]
+
+    def search_params(self, hnsw_ef=None) -> models.SearchParams:
+        # hnsw_ef trades recall for latency: a smaller beam visits fewer graph
+        # nodes. The collection stores INT8-quantized vectors; oversample on the
+        # quantized index and rescore with the original vectors to keep recall.
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef or self.hnsw_ef,
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0),
+        )
+
+    async def retrieve(self, embeddings: list[list[float]], hnsw_efs=None) -> list[list[NodeWithScore]]:
+        """
+        Run one batched Qdrant search and return the top nodes per embedding.
+        hnsw_efs optionally gives a per-embedding search beam width.
+        """
+        if hnsw_efs is None:
+            hnsw_efs = [None] * len(embeddings)
+        responses = await self.qdrant.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=embedding,
+                    limit=self.similarity_top_k,
+                    params=self.search_params(hnsw_ef),
+                    with_payload=True,
+                    with_vector=self._use_mmr,
+                )
+                for embedding, hnsw_ef in zip(embeddings, hnsw_efs)
+            ],
+        )
+        results = []
+        for embedding, response in zip(embeddings, responses):
+            points = response.points
+            if self._use_mmr and len(points) > self.mmr_top_n:
+                points = self._mmr(embedding, points)
+            results.append([
+                NodeWithScore(node=metadata_dict_to_node(point.payload), score=point.score)
+                for point in points
+            ])
+        return results
+
+    @property
+    def _use_mmr(self) -> bool:
+        return bool(self.mmr_top_n) and self.mmr_top_n < self.similarity_top_k
+
+    def _mmr(self, embedding, points):
+        _, ids = get_top_k_mmr_embeddings(
+            embedding,
+            [point.vector for point in points],
+            similarity_top_k=self.mmr_top_n,
+            mmr_threshold=1 - self.mmr_diversity,
+        )
+        return [points[i] for i in ids]
+
+    async def synthesize(self, question: str, nodes: list[NodeWithScore], use_cache: bool = True) -> str:
+        use_cache = use_cache and self.context_cache is not None
+        if use_cache:
+            cached = self.context_cache.get(nodes)
+            if cached is not None:
+                return cached
+        response = await self.synthesizer.asynthesize(question, nodes)
+        answer = response.response or ""
+        if use_cache:
+            self.context_cache.set(nodes, answer)
+        return answer
+
+    async def stream(self, question: str, nodes: list[NodeWithScore]):
+        """Yield answer tokens as the LLM produces them."""
+        if self.context_cache is not None:
+            cached = self.context_cache.get(nodes)
+            if cached is not None:
+                yield cached
+                return
+        response = await self.streaming_synthesizer.asynthesize(question, nodes)
+        tokens = []
+        async for token in response.async_response_gen():
+            tokens.append(token)
+            yield token
+        if self.context_cache is not None:
+            self.context_cache.set(nodes, "".join(tokens))
+
+    async def answer_batch(self, questions: list[str], hnsw_ef=None) -> list[str]:
+        # Sorting by length keeps similarly sized inputs together in the
+        # embed request; answers are returned in the caller's order.
+        order = sorted(range(len(questions)), key=lambda i: len(questions[i]))
+        sorted_questions = [questions[i] for i in order]
+
+        embeddings = await self.embed_queries(sorted_questions)
+        contexts = await self.retrieve(embeddings, [hnsw_ef] * len(embeddings))
+        answers = await asyncio.gather(
+            *(self.synthesize(q, nodes) for q, nodes in zip(sorted_questions, contexts))
+        )
+
+        results = [None] * len(questions)
+        for i, answer in zip(order, answers):
+            results[i] = answer
+        return results
+
+    async def warmup(self):
+        """
+        Run one tiny query end-to-end so connection pools, TLS sessions and
+        lazily imported LlamaIndex modules are ready before the first request.
+        """
+        await self.qdrant.get_collections()
+        embeddings = await self.embed_queries(["warmup"])
+        contexts = await self.retrieve(embeddings)
+        # The dummy answer must not be cached under real chunks
+        await self.synthesize("warmup", contexts[0], use_cache=False)
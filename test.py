@@ -2,7 +2,8 @@
 
 import os
 import qdrant_client
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext
+from qdrant_client import models
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, Settings
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from llama_index.embeddings.cohere import CohereEmbedding
 from llama_index.llms.cohere import Cohere
@@ -39,6 +40,28 @@ def run_rag_test():
     except Exception:
         print(f"⚠️  Could not delete collection (it may not have existed, which is fine).")
 
+    # Pre-create the collection with INT8 scalar quantization. The quantized
+    # vectors stay in RAM for fast HNSW traversal while the original float32
+    # vectors live on disk and are only read to rescore the top candidates.
+    client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=models.VectorParams(
+            size=1024,  # embed-english-v3.0
+            distance=models.Distance.COSINE,
+            on_disk=True
+        ),
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        ),
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=128),
+        on_disk_payload=True
+    )
+    print(f"✅ Created collection '{COLLECTION_NAME}' with INT8 scalar quantization.")
+
     # (B) Load documents from the './data' folder
     try:
         file_path="C://Users//RiteshRaut//fast_api//rag_1//final_kb.pdf"
@@ -55,13 +78,27 @@ def run_rag_test():
     ingest_embed_model = CohereEmbedding(
         model_name="embed-english-v3.0",
         api_key=COHERE_API_KEY,
-        input_type="search_document"  # CRITICAL for ingestion
+        input_type="search_document",  # CRITICAL for ingestion
+        embed_batch_size=96  # Cohere's per-request maximum
+    )
+    # The sync add() path uploads in batches of 128 over 4 parallel workers;
+    # the async path would upsert batch by batch and ignore `parallel`.
+    vector_store = QdrantVectorStore(
+        client=client,
+        collection_name=COLLECTION_NAME,
+        batch_size=128,
+        parallel=4
     )
-    vector_store = QdrantVectorStore(client=client, collection_name=COLLECTION_NAME)
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    
-    VectorStoreIndex.from_documents(
-        documents,
+
+    # Chunk up front and sort by length so each embed batch holds chunks of
+    # similar size.
+    nodes = Settings.node_parser.get_nodes_from_documents(documents)
+    nodes.sort(key=lambda n: len(n.get_content()))
+    print(f"✅ Split into {len(nodes)} chunk(s).")
+
+    VectorStoreIndex(
+        nodes,
         storage_context=storage_context,
         embed_model=ingest_embed_model,
         show_progress=True
@@ -0,0 +1,97 @@
+# tune_ef.py
+
+import os
+import sys
+import time
+import cohere
+import qdrant_client
+from qdrant_client import models
+from dotenv import load_dotenv
+from rag import COHERE_MAX_EMBED_TEXTS
+
+COLLECTION_NAME = "second"
+EF_VALUES = [16, 32, 64, 128, 256]
+
+DEFAULT_QUESTIONS = [
+    "what is acne?",
+    "how do I choose a moisturizer for oily skin?",
+    "what causes eczema flare-ups?",
+    "how often should sunscreen be reapplied?",
+    "what is the difference between retinol and tretinoin?",
+    "how can I reduce dark circles under my eyes?",
+    "what are the symptoms of rosacea?",
+    "is it safe to use vitamin C and niacinamide together?",
+]
+
+def run_ef_sweep():
+    """
+    Sweeps Qdrant's hnsw_ef over a held-out question set and reports recall@k
+    against an exact (brute-force) search, plus the mean search latency.
+    Pick the smallest ef where recall plateaus and set it as QDRANT_HNSW_EF.
+
+    Usage: python tune_ef.py [questions.txt]  (one question per line)
+    """
+    load_dotenv()
+    TOP_K = int(os.getenv("SIMILARITY_TOP_K", "8"))  # same setting as main.py
+    COHERE_API_KEY = os.getenv("CO_API_KEY")
+    QDRANT_URL = os.getenv("QDRANT_URL")
+    QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+    if not all([COHERE_API_KEY, QDRANT_URL, QDRANT_API_KEY]):
+        print("❌ ERROR: One or more environment variables are missing.")
+        return
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_QUESTIONS
+    print(f"✅ Using {len(questions)} held-out question(s).")
+
+    co = cohere.Client(api_key=COHERE_API_KEY)
+    client = qdrant_client.QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    # Cohere caps texts per embed request, so embed large question files in chunks
+    embeddings = []
+    for i in range(0, len(questions), COHERE_MAX_EMBED_TEXTS):
+        embeddings.extend(co.embed(
+            texts=questions[i:i + COHERE_MAX_EMBED_TEXTS],
+            model="embed-english-v3.0",
+            input_type="search_query"
+        ).embeddings)
+
+    def search(embedding, params):
+        return client.query_points(
+            collection_name=COLLECTION_NAME,
+            query=embedding,
+            limit=TOP_K,
+            search_params=params
+        ).points
+
+    # Ground truth: exact search over the full-precision vectors. Qdrant
+    # would still score with the INT8 copies unless quantization is ignored.
+    exact_params = models.SearchParams(
+        exact=True,
+        quantization=models.QuantizationSearchParams(ignore=True)
+    )
+    exact = [
+        {point.id for point in search(e, exact_params)}
+        for e in embeddings
+    ]
+
+    print(f"{'ef':>6} {'recall@' + str(TOP_K):>10} {'mean ms':>10}")
+    for ef in EF_VALUES:
+        params = models.SearchParams(
+            hnsw_ef=ef,
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+        )
+        hits, elapsed = 0, 0.0
+        for embedding, truth in zip(embeddings, exact):
+            start = time.perf_counter()
+            points = search(embedding, params)
+            elapsed += time.perf_counter() - start
+            hits += len(truth & {point.id for point in points})
+        recall = hits / sum(len(truth) for truth in exact)
+        print(f"{ef:>6} {recall:>10.3f} {1000 * elapsed / len(embeddings):>10.1f}")
+
+if __name__ == "__main__":
+    run_ef_sweep()